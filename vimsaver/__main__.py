@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
 import re
-import json
 import argparse
 import pprint
 import logging
 import vimsaver.multiplexers
+import vimsaver.statefile
+from vimsaver.appstates import AppStateTuple
 from importlib import import_module
 
 PATTERN_HISTORY = re.compile( r'\s*(?P<idx>[0-9]*)\s*(?P<cli>.*)' )
@@ -30,13 +31,13 @@ def innerloop_save(
         app_instance = app_handler.APPSTATE_CLASS( ps, **kwargs )
 
         buffers = app_instance.save_buffers()
-        screen_list[window.index] = {
-            'pwd': ps.pwd,
-            'app': app_instance.module_path,
-            'title': app_instance.server_name,
-            'buffers': {app_instance.server_name: \
-                [dict( x._asdict() ) for x in buffers]}
-        }
+        screen_list[window.index] = vimsaver.statefile.WindowState(
+            idx=window.index,
+            pwd=ps.pwd,
+            app=app_instance.module_path,
+            title=app_instance.server_name,
+            buffers={app_instance.server_name: \
+                [AppStateTuple( *x ) for x in buffers]} )
 
 def innerloop_quit(
     screen_list : dict, ps : vimsaver.multiplexers.PS,
@@ -101,8 +102,8 @@ def do_op( op_innerloop, **kwargs ):
     pprint.pprint( screen_list )
 
     if 'outfile' in kwargs:
-        with open( kwargs['outfile'], 'w' ) as outfile_f:
-            outfile_f.write( json.dumps( screen_list ) )
+        vimsaver.statefile.write_state(
+            kwargs['outfile'], screen_list.values() )
 
 def do_load( op_func, **kwargs ):
 
@@ -115,46 +116,57 @@ def do_load( op_func, **kwargs ):
 
     multiplexer_i = multiplexer.MULTIPLEXER_CLASS( kwargs['session'] )
 
-    with open( kwargs['infile'], 'r' ) as infile_f:
+    # Reject corrupt snapshots before any window is touched.
+    window_count = vimsaver.statefile.validate_state( kwargs['infile'] )
+    logger.debug( 'validated %d windows in %s',
+        window_count, kwargs['infile'] )
 
-        screen_state = json.loads( infile_f.read() )
+    for screen in vimsaver.statefile.read_state( kwargs['infile'] ):
 
-        for screen in screen_state:
-            pwd = screen_state[screen]['pwd']
+        # The multiplexer should handle detecting whether it's already open.
+        multiplexer_i.new_window( screen.idx )
 
-            # The multiplexer should handle detecting whether it's already open.
-            multiplexer_i.new_window( screen )
+        multiplexer_i.set_window_title( screen.idx, screen.title )
 
-            multiplexer_i.set_window_title(
-                screen, screen_state[screen]['title'] )
+        app = import_module( screen.app )
 
-            app = import_module( screen_state[screen]['app'] )
+        # Reopen vim buffers.
+        # TODO: Only if not already open!
+        for server in screen.buffers:
 
-            # Reopen vim buffers.
-            # TODO: Only if not already open!
-            for server in screen_state[screen]['buffers']:
+            app_i = app.APPSTATE_CLASS(
+                None, server_name=server, bufferlist=kwargs['bufferlist'] )
 
-                app_i = app.APPSTATE_CLASS(
-                    None, server_name=server, bufferlist=kwargs['bufferlist'] )
+            if app_i.is_server_open():
+                logger.warning( '%s is already open...', server )
+                continue
 
-                if app_i.is_server_open():
-                    logger.warning( '%s is already open...', server )
-                    continue
+            # Convert buffer list into command line.
+            buffer_list = [b.path for b in screen.buffers[server] \
+                if None != b.path]
 
-                # Convert buffer list into command line.
-                buffer_list = [b['path'] for b in \
-                        screen_state[screen]['buffers'][server]]
+            logger.debug(
+                'switching screen %s to pwd: %s', server, screen.pwd )
+            multiplexer_i.send_shell( ['cd', screen.pwd], screen.idx )
 
-                logger.debug(
-                    'switching screen %s to pwd: %s', server, pwd )
-                multiplexer_i.send_shell( ['cd', pwd], int( screen ) )
+            logger.debug( 'opening buffers in screen %s vim: %s',
+                server, buffer_list )
+            multiplexer_i.send_shell(
+                # TODO: Send shell command to start correct app.
+                ['vim', '--servername', server, '-p'] + buffer_list,
+                screen.idx )
 
-                logger.debug( 'opening buffers in screen %s vim: %s',
-                    server, buffer_list )
-                multiplexer_i.send_shell(
-                    # TODO: Send shell command to start correct app.
-                    ['vim', '--servername', server, '-p'] + buffer_list,
-                    int( screen ) )
+def do_migrate( op_func, **kwargs ):
+
+    logger = logging.getLogger( 'migrate' )
+
+    # Validate the whole file first so a bad snapshot is left alone.
+    window_count = vimsaver.statefile.validate_state( kwargs['infile'] )
+    logger.debug( 'upgrading %d windows in %s to version %d...',
+        window_count, kwargs['infile'], vimsaver.statefile.STATE_VERSION )
+
+    vimsaver.statefile.write_state( kwargs['outfile'],
+        vimsaver.statefile.read_state( kwargs['infile'] ) )
 
 def main():
 
@@ -190,6 +202,15 @@ def main():
 
     parser_load.set_defaults( func=do_load, op=None )
 
+    parser_migrate = subparsers.add_parser( 'migrate',
+        help='Upgrade a state file to the current format.' )
+
+    parser_migrate.add_argument( '-i', '--infile', default='vimsaver.json' )
+
+    parser_migrate.add_argument( '-o', '--outfile', default='vimsaver.json' )
+
+    parser_migrate.set_defaults( func=do_migrate, op=None )
+
     parser_quit = subparsers.add_parser( 'quit' )
 
     parser_quit.set_defaults( func=do_op, op=innerloop_quit )
@@ -66,7 +66,7 @@ class VimState( AppState ):
         # Add vim buffers to list.
         lines_out = []
         for line in vip.stdout.readlines():
-            match = PATTERN_BUFFERLIST.match( line.decode( 'utf-8' ) )
+            match = PATTERN_BUFFERLIST.match( line.decode( 'utf-8', 'surrogateescape' ) )
             if not match:
                 continue
             match = match.groupdict()
@@ -75,8 +75,9 @@ class VimState( AppState ):
                 # Skip hidden buffers.
                 continue
 
-            # Make index a number.
+            # Make index and line numbers.
             match['idx'] = int( match['idx'] )
+            match['line'] = int( match['line'] )
 
             # Account for buffer modes.
             if ' ' == match['insert']:
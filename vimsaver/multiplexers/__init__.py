@@ -86,7 +86,8 @@ class Window( object ):
                 # Get PWD.
                 pwdp = subprocess.Popen(
                     ['pwdx', match['pid']], stdout=subprocess.PIPE )
-                pwd_arr = pwdp.stdout.read().decode( 'utf-8' ).split( ' ' )
+                pwd_arr = pwdp.stdout.read().decode(
+                    'utf-8', 'surrogateescape' ).split( ' ' )
                 #print( pwd_arr )
                 match['pwd'] = pwd_arr[1].strip()
 
@@ -0,0 +1,209 @@
+
+''' Read and write vimsaver state files.
+
+A state file is a stream of JSON records, one per line:
+
+ - a header: {"t": "header", "version": 1}
+ - one record per window:
+   {"t": "window", "idx": 0, "pwd": "...", "app": "...", "title": "...",
+    "buffers": {"<server>": [[idx, stat, insert, path, line], ...]}}
+ - a footer: {"t": "end", "windows": <number of window records>}
+
+Buffer rows follow the field order of AppStateTuple. Records are written
+ASCII-escaped, so paths that are not valid UTF-8 survive the round trip as
+surrogate escapes (see os.fsdecode()).
+
+Files written by vimsaver v0.2 (one JSON object keyed by window index
+strings) are treated as version 0 and upgraded as they are read. '''
+
+import os
+import json
+import logging
+import typing
+import tempfile
+import collections
+from vimsaver.appstates import AppStateTuple
+
+STATE_VERSION = 1
+
+WindowState = collections.namedtuple(
+    'WindowState', ['idx', 'pwd', 'app', 'title', 'buffers'] )
+
+class StateFileException( Exception ):
+    pass
+
+def _check( condition : bool, lineno : int, message : str ) -> None:
+    if not condition:
+        raise StateFileException( f'line {lineno}: {message}' )
+
+def _check_int( value, lineno : int, field : str ) -> None:
+    # bool is an int subclass, but never a valid index.
+    _check( isinstance( value, int ) and not isinstance( value, bool ) \
+        and 0 <= value, lineno, f'{field} must be a non-negative integer' )
+
+def _check_str( value, lineno : int, field : str ) -> None:
+    _check( isinstance( value, str ), lineno, f'{field} must be a string' )
+
+def _window_from_record( record : dict, lineno : int ) -> WindowState:
+
+    ''' Validate a window record and convert it into a WindowState. '''
+
+    _check_int( record.get( 'idx' ), lineno, 'idx' )
+    _check_str( record.get( 'pwd' ), lineno, 'pwd' )
+    _check_str( record.get( 'app' ), lineno, 'app' )
+    _check_str( record.get( 'title' ), lineno, 'title' )
+    _check( isinstance( record.get( 'buffers' ), dict ), lineno,
+        'buffers must be an object' )
+
+    buffers = {}
+    for server, rows in record['buffers'].items():
+        _check( isinstance( rows, list ), lineno,
+            f'buffers for {server} must be a list' )
+        buffers[server] = []
+        for row in rows:
+            _check( isinstance( row, list ) and \
+                len( AppStateTuple._fields ) == len( row ), lineno,
+                f'malformed buffer row for {server}' )
+            buf = AppStateTuple( *row )
+            _check_int( buf.idx, lineno, 'buffer idx' )
+            _check_str( buf.stat, lineno, 'buffer stat' )
+            _check_str( buf.insert, lineno, 'buffer insert' )
+            _check( None == buf.path or isinstance( buf.path, str ), lineno,
+                'buffer path must be a string or null' )
+            _check_int( buf.line, lineno, 'buffer line' )
+            buffers[server].append( buf )
+
+    return WindowState( record['idx'], record['pwd'], record['app'],
+        record['title'], buffers )
+
+def _window_to_record( window : WindowState ) -> dict:
+    return {
+        't': 'window',
+        'idx': window.idx,
+        'pwd': os.fsdecode( window.pwd ),
+        'app': window.app,
+        'title': window.title,
+        'buffers': {server: [
+            [b.idx, b.stat, b.insert,
+                None if None == b.path else os.fsdecode( b.path ), b.line]
+            for b in rows] for server, rows in window.buffers.items()}
+    }
+
+def _migrate_v0( state ) -> list:
+
+    ''' Convert a v0.2 state object into a list of validated windows. '''
+
+    logger = logging.getLogger( 'statefile.migrate' )
+
+    _check( isinstance( state, dict ), 1, 'not a vimsaver state file' )
+
+    logger.debug( 'upgrading %d windows from version 0...', len( state ) )
+
+    windows = []
+    for screen in state:
+        try:
+            record = dict( state[screen] )
+            record['idx'] = int( screen )
+            record['buffers'] = {server: [
+                [int( b['idx'] ), b['stat'], b['insert'], b['path'],
+                    int( b['line'] )]
+                for b in rows] for server, rows in record['buffers'].items()}
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            raise StateFileException(
+                f'window {screen}: malformed version 0 window' ) from e
+        windows.append( _window_from_record( record, 1 ) )
+
+    return windows
+
+def read_state( path : str ) -> typing.Generator[WindowState, None, None]:
+
+    ''' Yield a WindowState for each window in the state file at path, as
+    soon as each one has been read and validated. A StateFileException is
+    raised when a corrupt record is found or the file ends early, so use
+    validate_state() first if nothing should be touched in that case. '''
+
+    with open( path, 'r', encoding='utf-8', errors='surrogateescape' ) \
+    as infile_f:
+
+        try:
+            header = json.loads( infile_f.readline() )
+        except ValueError as e:
+            raise StateFileException( 'line 1: not a vimsaver state file' ) \
+                from e
+
+        if not isinstance( header, dict ) or 'header' != header.get( 't' ):
+            # v0.2 files are a single JSON object with no header.
+            infile_f.seek( 0 )
+            try:
+                state = json.load( infile_f )
+            except ValueError as e:
+                raise StateFileException( 'not a vimsaver state file' ) from e
+            yield from _migrate_v0( state )
+            return
+
+        _check( STATE_VERSION == header.get( 'version' ), 1,
+            f'unsupported state version: {header.get( "version" )}' )
+
+        seen = set()
+        count = None
+        lineno = 1
+        for lineno, line in enumerate( infile_f, 2 ):
+            _check( None == count, lineno, 'data after end record' )
+
+            try:
+                record = json.loads( line )
+            except ValueError as e:
+                raise StateFileException( f'line {lineno}: {e}' ) from e
+            _check( isinstance( record, dict ), lineno, 'not a record' )
+
+            if 'window' == record.get( 't' ):
+                window = _window_from_record( record, lineno )
+                _check( window.idx not in seen, lineno,
+                    f'duplicate window {window.idx}' )
+                seen.add( window.idx )
+                yield window
+
+            elif 'end' == record.get( 't' ):
+                count = record.get( 'windows' )
+                _check( len( seen ) == count, lineno,
+                    f'expected {count} windows, found {len( seen )}' )
+
+            else:
+                _check( False, lineno, f'unknown record: {record.get( "t" )}' )
+
+        _check( None != count, lineno, 'missing end record (truncated?)' )
+
+def validate_state( path : str ) -> int:
+
+    ''' Read through the state file at path without keeping it in memory,
+    and return the number of windows it holds. '''
+
+    count = 0
+    for window in read_state( path ):
+        count += 1
+    return count
+
+def write_state( path : str, windows ) -> None:
+
+    ''' Write the given WindowStates to path in the current state format.
+    The old file is only replaced once the new one is complete. '''
+
+    out_dir = os.path.dirname( os.path.abspath( path ) )
+    out_fd, out_path = tempfile.mkstemp(
+        prefix='.vimsaver', suffix='.tmp', dir=out_dir )
+
+    try:
+        with os.fdopen( out_fd, 'w', encoding='ascii' ) as outfile_f:
+            outfile_f.write( json.dumps(
+                {'t': 'header', 'version': STATE_VERSION} ) + '\n' )
+            count = 0
+            for window in windows:
+                outfile_f.write(
+                    json.dumps( _window_to_record( window ) ) + '\n' )
+                count += 1
+            outfile_f.write(
+                json.dumps( {'t': 'end', 'windows': count} ) + '\n' )
+        os.replace( out_path, path )
+    except BaseException:
+        os.unlink( out_path )
+        raise